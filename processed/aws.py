@@ -0,0 +1,20 @@
+import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def s3_client():
+    """
+    Shared S3 client, created on first use.
+
+    boto3 is imported here rather than at module load so API processes that
+    never touch S3 do not pay its import time and memory.
+    """
+    import boto3
+    return boto3.client('s3', region_name=os.environ.get('AWS_S3_REGION_NAME'))
+
+def bucket_name():
+    return os.environ.get('AWS_STORAGE_BUCKET_NAME')
+
+def bucket_url(key):
+    return f"{os.environ.get('AWS_S3_BUCKET_URL')}/{key}"
@@ -0,0 +1,187 @@
+import gzip
+import io
+import os
+from urllib.parse import unquote, urlparse
+
+# Supported codecs for uploads and processed outputs. 'none' keeps plain csv.
+CODECS = {
+    'none': {'suffix': '', 'magic': None, 'content_encoding': None},
+    'gzip': {'suffix': '.gz', 'magic': b'\x1f\x8b', 'content_encoding': 'gzip'},
+    'zstd': {'suffix': '.zst', 'magic': b'\x28\xb5\x2f\xfd', 'content_encoding': 'zstd'},
+}
+
+MAGIC_PREFIX_LENGTH = 4
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+
+def validate_codec(codec):
+    codec = (codec or 'none').lower()
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported compression codec '{codec}'")
+    return codec
+
+def key_from_url(url):
+    """Return the S3 object key (file name) referenced by a bucket or presigned URL."""
+    return os.path.basename(unquote(urlparse(url).path))
+
+def codec_from_key(key):
+    for codec, spec in CODECS.items():
+        if spec['suffix'] and key.endswith(spec['suffix']):
+            return codec
+    return 'none'
+
+def codec_from_magic(prefix):
+    for codec, spec in CODECS.items():
+        if spec['magic'] and prefix.startswith(spec['magic']):
+            return codec
+    return 'none'
+
+def unprocessed_file_key(task_id, codec='none'):
+    return f"{task_id}_unprocessed.csv{CODECS[codec]['suffix']}"
+
+def processed_file_key(task_id, codec='none'):
+    return f"{task_id}_processed.csv{CODECS[codec]['suffix']}"
+
+def content_encoding(codec):
+    return CODECS[codec]['content_encoding']
+
+def _quality(params):
+    """Parse the q-value of an Accept-Encoding entry, treating malformed values as 0."""
+    for param in params.split(';'):
+        name, _, value = param.strip().partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+def accepts_encoding(accept_encoding, codec):
+    """
+    Check whether an Accept-Encoding header allows the given codec to be sent as-is.
+
+    An entry naming the coding takes precedence over '*' (RFC 9110, section 12.5.3).
+    """
+    encoding = content_encoding(codec)
+    if encoding is None:
+        return True
+
+    qualities = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if name:
+            qualities[name] = _quality(params)
+
+    if encoding in qualities:
+        return qualities[encoding] > 0
+    return qualities.get('*', 0) > 0
+
+def pandas_compression(codec, level):
+    """Build the `compression` argument for DataFrame.to_csv."""
+    if codec == 'gzip':
+        return {'method': 'gzip', 'compresslevel': level, 'mtime': 0}
+    if codec == 'zstd':
+        return {'method': 'zstd', 'level': level}
+    return None
+
+def upload_extra_args(codec):
+    extra_args = {'ContentType': 'text/csv'}
+    if content_encoding(codec):
+        extra_args['ContentEncoding'] = content_encoding(codec)
+    return extra_args
+
+
+class _GzipReader(gzip.GzipFile):
+    """GzipFile that also closes the stream it was given, e.g. the S3 body."""
+
+    def close(self):
+        fileobj = self.fileobj
+        try:
+            super().close()
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+
+class _PrefixedStream(io.RawIOBase):
+    """Raw stream that replays already-consumed bytes before the rest of the body."""
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            self.bytes_read += size
+            return size
+
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+    def close(self):
+        if hasattr(self._stream, 'close'):
+            self._stream.close()
+        super().close()
+
+
+def iter_stream(stream, chunk_size=STREAM_BUFFER_SIZE):
+    """Yield a binary stream in chunks, closing it once exhausted or abandoned."""
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        stream.close()
+
+def decompression_errors():
+    """Exception types raised by the decompressors on damaged input."""
+    errors = (OSError, EOFError)
+    try:
+        import zstandard
+    except ImportError:
+        return errors
+    return errors + (zstandard.ZstdError,)
+
+def prepend(prefix, stream):
+    """
+    Return a buffered stream that yields `prefix` followed by the rest of `stream`.
+
+    The number of bytes handed out so far is available as `.raw.bytes_read`.
+    """
+    return io.BufferedReader(_PrefixedStream(prefix, stream), buffer_size=STREAM_BUFFER_SIZE)
+
+def open_decompressed(stream, key=''):
+    """
+    Wrap a binary stream (e.g. an S3 StreamingBody) so reads yield decompressed bytes.
+
+    The codec is sniffed from the magic bytes at the start of the stream so
+    mislabelled uploads are still handled; the key suffix is only used when the
+    body is too short to sniff. Nothing is buffered beyond STREAM_BUFFER_SIZE,
+    so the parser consumes the body as it arrives.
+    """
+    prefix = stream.read(MAGIC_PREFIX_LENGTH)
+    codec = codec_from_magic(prefix)
+    if codec == 'none' and len(prefix) < MAGIC_PREFIX_LENGTH:
+        codec = codec_from_key(key)
+
+    raw = prepend(prefix, stream)
+
+    if codec == 'gzip':
+        return _GzipReader(fileobj=raw, mode='rb'), codec
+    if codec == 'zstd':
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader, buffer_size=STREAM_BUFFER_SIZE), codec
+    return raw, codec
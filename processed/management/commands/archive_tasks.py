@@ -0,0 +1,70 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from processed.models import ProcessedFile, ArchivedProcessedFile
+
+FINISHED_STATUSES = ['Processed', 'Success', 'Failed', 'Corrupted']
+ARCHIVED_FIELDS = [
+    'user_id', 'unprocessed_file_url', 'processed_file_url', 'task_id', 'status', 'errors',
+    'size_bytes', 'row_count', 'started_at', 'created_at', 'updated_at',
+]
+
+
+class Command(BaseCommand):
+    help = 'Move finished tasks out of the hot ProcessedFile table into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.PROCESSED_FILE_ARCHIVE_AFTER_DAYS, help='Archive finished tasks created more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tasks moved per transaction')
+        parser.add_argument('--interval', type=float, default=None, help='Keep running, archiving again every this many seconds')
+
+    def archive_batch(self, cutoff, batch_size):
+        with transaction.atomic():
+            # Rows whose task_id is somehow already archived are left in place rather than
+            # overwritten or lost, and skipped so they cannot stall later batches. NOT EXISTS
+            # plans as an anti-join, unlike NOT IN which also has to account for NULLs.
+            batch = list(
+                ProcessedFile.objects.select_for_update(skip_locked=True)
+                .filter(status__in=FINISHED_STATUSES, created_at__lt=cutoff)
+                .filter(~Exists(ArchivedProcessedFile.objects.filter(task_id=OuterRef('task_id'))))
+                .order_by('created_at', 'id')[:batch_size]
+            )
+            if not batch:
+                return 0
+
+            ArchivedProcessedFile.objects.bulk_create(
+                [ArchivedProcessedFile(**{field: getattr(file_entry, field) for field in ARCHIVED_FIELDS}) for file_entry in batch]
+            )
+            ProcessedFile.objects.filter(pk__in=[file_entry.pk for file_entry in batch]).delete()
+            return len(batch)
+
+    def archive(self, older_than_days, batch_size):
+        cutoff = timezone.now() - timedelta(days=older_than_days)
+        total = 0
+        while True:
+            archived = self.archive_batch(cutoff, batch_size)
+            total += archived
+            if archived < batch_size:
+                return total
+
+    def handle(self, *args, **options):
+        if options['interval'] is None:
+            total = self.archive(options['older_than_days'], options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Archived {total} tasks'))
+            return
+
+        while True:
+            # Long-running loops never see request signals, so recycle stale or broken connections here.
+            close_old_connections()
+            try:
+                total = self.archive(options['older_than_days'], options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f'Archived {total} tasks'))
+            except DatabaseError as e:
+                self.stderr.write(f'Archiving failed, retrying in {options["interval"]}s: {e}')
+            time.sleep(options['interval'])
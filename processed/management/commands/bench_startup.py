@@ -0,0 +1,56 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Each profile is run in a fresh interpreter so import time and RSS are measured cold.
+CHILD_SCRIPT = '''
+import json, os, resource, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+import backend.urls
+{extra}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'import_seconds': elapsed, 'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+'''
+
+PROFILES = {
+    'api': '',
+    'worker': 'import processed.pipeline',
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure cold startup time and peak RSS of the API process versus a processing worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Number of cold starts per profile')
+
+    def run_profile(self, extra):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-c', CHILD_SCRIPT.format(extra=extra)],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        sample['total_seconds'] = time.perf_counter() - started
+        return sample
+
+    def handle(self, *args, **options):
+        # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+        rss_bytes = 1 if sys.platform == 'darwin' else 1024
+
+        for name, extra in PROFILES.items():
+            samples = [self.run_profile(extra) for _ in range(options['repeat'])]
+            self.stdout.write(
+                f"{name:<8} "
+                f"startup {statistics.median(s['total_seconds'] for s in samples) * 1000:8.1f} ms  "
+                f"imports {statistics.median(s['import_seconds'] for s in samples) * 1000:8.1f} ms  "
+                f"max rss {statistics.median(s['max_rss_kb'] for s in samples) * rss_bytes / 2 ** 20:7.1f} MiB"
+            )
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from processed.validation import CorruptFileError
+from processed.scheduler import LeaseLost, claim_next_task
+
+
+class Command(BaseCommand):
+    help = 'Run a processing worker that picks up files marked as ready to process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty instead of polling')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        # The data stack is only loaded by worker processes, never by the API.
+        from processed.pipeline import process_task, get_model
+
+        get_model()
+
+        while True:
+            # Long-running loops never see request signals, so recycle stale or broken
+            # connections here; CONN_MAX_AGE and CONN_HEALTH_CHECKS rely on it.
+            close_old_connections()
+            try:
+                file_entry = claim_next_task()
+            except DatabaseError as e:
+                self.stderr.write(f'Could not claim a task, retrying in {options["interval"]}s: {e}')
+                time.sleep(options['interval'])
+                continue
+
+            if file_entry is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+
+            try:
+                process_task(file_entry)
+                self.stdout.write(self.style.SUCCESS(f'Processed {file_entry.task_id}'))
+            except LeaseLost as e:
+                self.stderr.write(f'{e}')
+            except CorruptFileError as e:
+                self.stderr.write(f'Rejected corrupted file {file_entry.task_id}: {e}')
+            except Exception as e:
+                self.stderr.write(f'Failed to process {file_entry.task_id}: {e}')
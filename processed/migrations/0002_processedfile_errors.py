@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processed', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processedfile',
+            name='errors',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
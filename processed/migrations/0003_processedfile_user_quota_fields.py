@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-19 11:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('processed', '0002_processedfile_errors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processedfile',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='processed_files', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='processedfile',
+            name='size_bytes',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='processedfile',
+            name='row_count',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='processedfile',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.1 on 2026-10-19 12:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('processed', '0003_processedfile_user_quota_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processedfile',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='processedfile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='processedfile',
+            index=models.Index(fields=['status', 'created_at'], name='processed_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='processedfile',
+            index=models.Index(fields=['user', 'started_at'], name='processed_user_started_idx'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedProcessedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unprocessed_file_url', models.URLField()),
+                ('processed_file_url', models.URLField(blank=True, null=True)),
+                ('task_id', models.CharField(max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('Read-to-Upload', 'Read-to-Upload'), ('Read-to-Process', 'Read-to-Process'), ('Success', 'Success'), ('Failed', 'Failed'), ('Corrupted', 'Corrupted')], max_length=20)),
+                ('errors', models.JSONField(blank=True, null=True)),
+                ('size_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('row_count', models.BigIntegerField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_files', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
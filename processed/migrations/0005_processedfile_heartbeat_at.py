@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processed', '0004_processedfile_timestamps_indexes_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processedfile',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
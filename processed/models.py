@@ -1,5 +1,5 @@
 from django.db import models
-from django.contrib.auth.models import User as AuthUser
+from django.conf import settings
 
 class ProcessedFile(models.Model):
     STATUS_CHOICES = [
@@ -10,10 +10,43 @@ class ProcessedFile(models.Model):
         ('Corrupted', 'Corrupted'),
     ]
 
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='processed_files', null=True)
     unprocessed_file_url = models.URLField()
     processed_file_url = models.URLField(null=True, blank=True)
     task_id = models.CharField(max_length=255, unique=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Processing')
+    errors = models.JSONField(null=True, blank=True)
+    size_bytes = models.BigIntegerField(null=True, blank=True)
+    row_count = models.BigIntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='processed_status_created_idx'),
+            models.Index(fields=['user', 'started_at'], name='processed_user_started_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s File - {self.status}"
+
+class ArchivedProcessedFile(models.Model):
+    """Finished tasks moved out of ProcessedFile by the archive_tasks command."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_files', null=True)
+    unprocessed_file_url = models.URLField()
+    processed_file_url = models.URLField(null=True, blank=True)
+    task_id = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20, choices=ProcessedFile.STATUS_CHOICES)
+    errors = models.JSONField(null=True, blank=True)
+    size_bytes = models.BigIntegerField(null=True, blank=True)
+    row_count = models.BigIntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s Archived File - {self.status}"
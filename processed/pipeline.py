@@ -0,0 +1,125 @@
+"""
+Processing engine for uploaded air quality files.
+
+This module pulls in the data stack (pandas, numpy, joblib) and is only
+imported by the process_files workers; the API just queues tasks, so its
+processes stay small and start quickly.
+"""
+import os
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from joblib import load
+
+from .aws import s3_client, bucket_name, bucket_url
+from .scheduler import LeaseLost, TaskLease, finish_task, renew_lease
+from .compression import (
+    validate_codec, key_from_url, processed_file_key, pandas_compression, upload_extra_args, open_decompressed, prepend,
+)
+from .validation import CorruptFileError, read_sample, validate_sample
+
+MODEL_PATH = 'air_quality_rf_model.joblib'
+
+
+# Helper functions for preprocessing
+def time_stamp_to_unix(datetime_str):
+    datetime_object = datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S UTC")
+    return int(datetime_object.timestamp())
+
+def preprocess_data(df):
+    df['unix_timestamp'] = df['timestamp'].apply(time_stamp_to_unix)
+    df.replace({'N/A': np.nan, 'Null': np.nan, 0: np.nan}, inplace=True)
+    df.sort_values(by=['device_id', 'unix_timestamp'], inplace=True)
+
+    return df.drop(columns=['timestamp'])
+
+@lru_cache(maxsize=None)
+def get_model():
+    """Load the imputation model once per worker process."""
+    return load(MODEL_PATH)
+
+def process_task(file_entry):
+    """
+    Run the pipeline for a task, recording the outcome on the task.
+
+    Uploads failing pre-flight validation are marked Corrupted with the reasons,
+    any other error marks the task Failed; the exception is re-raised either way.
+    The task's lease is renewed while it runs, and nothing is recorded once the
+    worker has lost it (LeaseLost is raised instead).
+    """
+    with TaskLease(file_entry) as lease:
+        try:
+            return _process(file_entry, lease)
+        except LeaseLost:
+            raise
+        except CorruptFileError as e:
+            finish_task(file_entry, status='Corrupted', errors=e.reasons)
+            raise
+        except Exception as e:
+            finish_task(file_entry, status='Failed', errors=[str(e)])
+            raise
+
+def _process(file_entry, lease):
+    """
+    Download, clean and impute a task's upload, then upload the processed file.
+
+    Marks the task as processed and returns the unprocessed/processed file URLs.
+    """
+    s3 = s3_client()
+    unprocessed_key = key_from_url(file_entry.unprocessed_file_url)
+    unprocessed_file_url = bucket_url(unprocessed_key)
+
+    # Stream the upload straight into the parser, decompressing on the fly. The
+    # head of the file is validated first and then replayed in front of the rest.
+    body = s3.get_object(Bucket=bucket_name(), Key=unprocessed_key)['Body']
+    stream, _ = open_decompressed(body, unprocessed_key)
+    with stream:
+        sample, lines = read_sample(stream)
+        validate_sample(lines)
+        replay = prepend(sample, stream)
+        df = pd.read_csv(replay)
+    # The validator accepts padded header names, so normalise them the same way here.
+    df.columns = df.columns.str.strip()
+    # Quotas are charged for the decompressed size, not the (much smaller) upload.
+    size_bytes = replay.raw.bytes_read
+    row_count = len(df)
+    df = preprocess_data(df)
+
+    model = get_model()
+
+    missing_indices = df[df.isnull().any(axis=1)].index
+
+    if not missing_indices.empty:
+        x_missing = df.loc[missing_indices, ['unix_timestamp', 'latitude', 'longitude']]
+        df.loc[missing_indices, ['humidity', 'temperature', 'pm10', 'pm2_5']] = model.predict(x_missing)
+
+    codec = validate_codec(settings.PROCESSED_FILE_CODEC)
+    processed_file_path = processed_file_key(file_entry.task_id, codec)
+
+    # The output key is shared by every run of the task, so don't overwrite the
+    # object once another worker may have taken the task over.
+    if lease.lost or not renew_lease(file_entry):
+        raise LeaseLost(f'Lost the lease on {file_entry.task_id}')
+
+    # Workers are long-lived, so the local copy must not outlive the upload, even on failure.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = os.path.join(tmp_dir, processed_file_path)
+        df.to_csv(local_path, index=False, compression=pandas_compression(codec, settings.PROCESSED_FILE_COMPRESSION_LEVEL))
+        s3.upload_file(local_path, bucket_name(), processed_file_path, ExtraArgs=upload_extra_args(codec))
+    processed_file_url = bucket_url(processed_file_path)
+
+    claimed = finish_task(
+        file_entry, status='Processed', processed_file_url=processed_file_url, errors=None,
+        size_bytes=size_bytes, row_count=row_count,
+    )
+    if not claimed:
+        raise LeaseLost(f'Lost the lease on {file_entry.task_id}, discarding its result')
+
+    return {
+        'unprocessed_file_url': unprocessed_file_url,
+        'processed_file_url': processed_file_url
+    }
@@ -0,0 +1,202 @@
+"""
+Fair-share scheduling of processing work across users.
+
+Each user may run at most PROCESSING_MAX_CONCURRENT_PER_USER tasks at once and
+start at most PROCESSING_QUOTA_MAX_ROWS rows / PROCESSING_QUOTA_MAX_BYTES bytes
+per PROCESSING_QUOTA_WINDOW_SECONDS. Among users with capacity, the next task
+goes to the user with the fewest tasks started in the window relative to their
+processing_weight, which gives a weighted round-robin over pending tasks. All
+state is read from the database, so any number of workers share one rotation,
+and rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED where supported.
+
+The byte quota counts decompressed bytes of the work done in the window. A
+queued file is checked against it by its upload size, which for compressed
+uploads is a lower bound; the row quota is the tighter limit for those.
+
+A claimed task is leased to its worker: while it is processed a TaskLease
+thread refreshes heartbeat_at every third of PROCESSING_LEASE_SECONDS. A task
+whose heartbeat is older than the lease (its worker was killed, ran out of
+memory, ...) no longer counts as running and is marked Failed the next time a
+worker looks for work, so it can be requeued. Results are only written while
+the worker still owns the task, i.e. it is still 'Processing' with the
+started_at of the worker's claim; a worker that lost its lease discards them.
+"""
+import threading
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from users.models import CustomUser
+from .models import ProcessedFile
+
+EMPTY_USAGE = {'running': 0, 'tasks': 0, 'rows': 0, 'bytes': 0}
+
+
+def window_start():
+    return timezone.now() - timedelta(seconds=settings.PROCESSING_QUOTA_WINDOW_SECONDS)
+
+class LeaseLost(Exception):
+    """Raised when a worker no longer owns the task it is processing."""
+
+
+def stale_tasks():
+    """Tasks whose processing lease has run out."""
+    lease_start = timezone.now() - timedelta(seconds=settings.PROCESSING_LEASE_SECONDS)
+    return (
+        ProcessedFile.objects.filter(status='Processing')
+        .alias(last_seen=Coalesce('heartbeat_at', 'started_at'))
+        .filter(Q(last_seen__lt=lease_start) | Q(last_seen__isnull=True))
+    )
+
+def expire_stale_tasks():
+    """Mark tasks whose lease has run out as Failed, returning how many were expired."""
+    return stale_tasks().update(
+        status='Failed',
+        errors=[f'Worker stopped reporting progress for {settings.PROCESSING_LEASE_SECONDS} seconds'],
+        updated_at=timezone.now(),
+    )
+
+def user_usage(user_ids):
+    """Running tasks and work started in the current quota window, keyed by user id."""
+    usage = {user_id: dict(EMPTY_USAGE) for user_id in user_ids}
+
+    running = ProcessedFile.objects.filter(status='Processing', user_id__in=user_ids).exclude(pk__in=stale_tasks().values('pk'))
+    for row in running.values('user_id').annotate(count=Count('id')).order_by():
+        usage[row['user_id']]['running'] = row['count']
+
+    recent = ProcessedFile.objects.filter(started_at__gte=window_start(), user_id__in=user_ids)
+    for row in recent.values('user_id').annotate(tasks=Count('id'), rows=Sum('row_count'), bytes=Sum('size_bytes')).order_by():
+        usage[row['user_id']].update(tasks=row['tasks'], rows=row['rows'] or 0, bytes=row['bytes'] or 0)
+
+    return usage
+
+def has_capacity(usage, size_bytes=None):
+    """
+    Check a user's usage against the concurrency limit and window quotas.
+
+    A file larger than the byte quota may still start when the user has nothing
+    else in the window, otherwise it could never run.
+    """
+    max_running = settings.PROCESSING_MAX_CONCURRENT_PER_USER
+    if max_running and usage['running'] >= max_running:
+        return False
+
+    max_rows = settings.PROCESSING_QUOTA_MAX_ROWS
+    if max_rows and usage['rows'] >= max_rows:
+        return False
+
+    max_bytes = settings.PROCESSING_QUOTA_MAX_BYTES
+    if max_bytes and usage['bytes'] and usage['bytes'] + (size_bytes or 0) > max_bytes:
+        return False
+
+    return True
+
+def claim_task(pk):
+    """Move a task from 'Ready to Process' to 'Processing', returning False if another worker got it first."""
+    now = timezone.now()
+    return bool(ProcessedFile.objects.filter(pk=pk, status='Ready to Process').update(status='Processing', started_at=now, heartbeat_at=now))
+
+def owned_task(file_entry):
+    """Queryset matching the task only while it is still held by the claim `file_entry` was loaded from."""
+    return ProcessedFile.objects.filter(pk=file_entry.pk, status='Processing', started_at=file_entry.started_at)
+
+def renew_lease(file_entry):
+    """Refresh the task's heartbeat, returning False if the worker no longer owns it."""
+    return bool(owned_task(file_entry).update(heartbeat_at=timezone.now()))
+
+def finish_task(file_entry, **fields):
+    """
+    Record a task's outcome if the worker still owns it.
+
+    Returns False, leaving the row untouched, when the lease was lost and the
+    task may already belong to another run.
+    """
+    fields['updated_at'] = timezone.now()
+    if not owned_task(file_entry).update(**fields):
+        return False
+    for name, value in fields.items():
+        setattr(file_entry, name, value)
+    return True
+
+
+class TaskLease:
+    """Context manager that keeps a claimed task's heartbeat fresh from a background thread."""
+
+    def __init__(self, file_entry, interval=None):
+        self.file_entry = file_entry
+        self.interval = interval or max(settings.PROCESSING_LEASE_SECONDS / 3, 1)
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    if not renew_lease(self.file_entry):
+                        self.lost = True
+                        return
+                except DatabaseError:
+                    # Keep trying; the lease only expires if this persists for PROCESSING_LEASE_SECONDS.
+                    pass
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def claim_oldest_task(user_id):
+    """Claim a user's oldest pending task, skipping rows another worker has locked."""
+    with transaction.atomic():
+        pk = (
+            ProcessedFile.objects.select_for_update(skip_locked=True)
+            .filter(status='Ready to Process', user_id=user_id)
+            .order_by('created_at', 'id').values_list('pk', flat=True).first()
+        )
+        # The conditional update still guards backends without row locks, such as SQLite.
+        if pk is None or not claim_task(pk):
+            return None
+    return ProcessedFile.objects.get(pk=pk)
+
+def claim_next_task():
+    """Claim the next task in fair-share order, or return None when no user has eligible work."""
+    expire_stale_tasks()
+
+    while True:
+        pending = dict(
+            ProcessedFile.objects.filter(status='Ready to Process')
+            .values('user_id').annotate(oldest=Min('id')).order_by()
+            .values_list('user_id', 'oldest')
+        )
+        if not pending:
+            return None
+
+        usage = user_usage([user_id for user_id in pending if user_id is not None])
+        weights = dict(CustomUser.objects.filter(pk__in=pending).values_list('pk', 'processing_weight'))
+        sizes = dict(ProcessedFile.objects.filter(pk__in=pending.values()).values_list('pk', 'size_bytes'))
+
+        candidates = []
+        for user_id, pk in pending.items():
+            entry = usage.get(user_id, EMPTY_USAGE)
+            if not has_capacity(entry, sizes.get(pk)):
+                continue
+            candidates.append((entry['tasks'] / max(weights.get(user_id, 1), 1), pk, user_id))
+
+        if not candidates:
+            return None
+
+        for _, _, user_id in sorted(candidates, key=lambda candidate: candidate[:2]):
+            file_entry = claim_oldest_task(user_id)
+            if file_entry is not None:
+                return file_entry
@@ -1,7 +1,12 @@
 from rest_framework import serializers
-from .models import ProcessedFile
+from .models import ProcessedFile, ArchivedProcessedFile
 
 class ProcessedFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProcessedFile
-        fields = ['task_id', 'status', 'unprocessed_file_url', 'processed_file_url']
+        fields = ['task_id', 'status', 'unprocessed_file_url', 'processed_file_url', 'errors']
+
+class ArchivedProcessedFileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedProcessedFile
+        fields = ['task_id', 'status', 'unprocessed_file_url', 'processed_file_url', 'errors']
@@ -1,3 +1,776 @@
-from django.test import TestCase
+import gzip
+import io
+import os
+import subprocess
+import sys
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DataError, DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.authentication import user_cache
+from users.models import CustomUser
+from users.serializers import LoginSerializerWithToken
+from .compression import accepts_encoding, open_decompressed, prepend
+from .models import ProcessedFile, ArchivedProcessedFile
+from .scheduler import (
+    EMPTY_USAGE, LeaseLost, TaskLease, claim_next_task, claim_oldest_task, finish_task, has_capacity, renew_lease,
+)
+from .validation import MAX_SAMPLE_BYTES, SAMPLE_ROWS, CorruptFileError, read_sample, validate_sample
+
+
+class AcceptsEncodingTests(SimpleTestCase):
+
+    def test_plain_files_are_always_accepted(self):
+        self.assertTrue(accepts_encoding('', 'none'))
+
+    def test_listed_coding_is_accepted(self):
+        self.assertTrue(accepts_encoding('gzip, deflate, br', 'gzip'))
+        self.assertFalse(accepts_encoding('gzip, deflate, br', 'zstd'))
+
+    def test_zero_quality_refuses_coding(self):
+        self.assertFalse(accepts_encoding('gzip;q=0', 'gzip'))
+        self.assertFalse(accepts_encoding('gzip; q=0.000', 'gzip'))
+        self.assertTrue(accepts_encoding('gzip;q=0.5', 'gzip'))
+
+    def test_explicit_coding_takes_precedence_over_wildcard(self):
+        self.assertTrue(accepts_encoding('*;q=0, gzip', 'gzip'))
+        self.assertFalse(accepts_encoding('*, gzip;q=0', 'gzip'))
+        self.assertTrue(accepts_encoding('*', 'zstd'))
+        self.assertFalse(accepts_encoding('*;q=0', 'zstd'))
+
+
+class OpenDecompressedTests(SimpleTestCase):
+
+    def test_gzip_is_sniffed_from_magic_bytes(self):
+        data = b'a,b\n1,2\n' * 100
+        stream, codec = open_decompressed(io.BytesIO(gzip.compress(data)), 'upload.csv')
+        self.assertEqual(codec, 'gzip')
+        self.assertEqual(stream.read(), data)
+
+    def test_prepend_counts_decompressed_bytes(self):
+        data = b'a,b\n1,2\n' * 100
+        stream, _ = open_decompressed(io.BytesIO(gzip.compress(data)))
+        replay = prepend(stream.read(10), stream)
+        replay.read()
+        self.assertEqual(replay.raw.bytes_read, len(data))
+
+    def test_zstd_is_sniffed_from_magic_bytes(self):
+        import zstandard
+
+        data = b'a,b\n1,2\n' * 100
+        stream, codec = open_decompressed(io.BytesIO(zstandard.ZstdCompressor().compress(data)), 'upload.csv')
+        self.assertEqual(codec, 'zstd')
+        self.assertEqual(stream.read(), data)
+
+    def test_plain_csv_passes_through(self):
+        data = b'a,b\n1,2\n'
+        stream, codec = open_decompressed(io.BytesIO(data), 'upload.csv.gz')
+        self.assertEqual(codec, 'none')
+        self.assertEqual(stream.read(), data)
+
+    def test_closing_gzip_stream_closes_source(self):
+        source = io.BytesIO(gzip.compress(b'a,b\n'))
+        stream, _ = open_decompressed(source, 'upload.csv.gz')
+        stream.close()
+        self.assertTrue(source.closed)
+
+
+HEADER = b'device_id,timestamp,latitude,longitude,humidity,temperature,pm10,pm2_5\n'
+ROW = b'a,2024-01-01 00:00:00 UTC,12.5,77.1,N/A,20,1,2\n'
+
+
+class ValidationTests(SimpleTestCase):
+
+    def assertCorrupt(self, data, reason):
+        with self.assertRaises(CorruptFileError) as context:
+            stream, _ = open_decompressed(io.BytesIO(data))
+            validate_sample(read_sample(stream)[1])
+        self.assertTrue(any(reason in r for r in context.exception.reasons), context.exception.reasons)
+
+    def test_valid_head_is_replayed_byte_for_byte(self):
+        data = HEADER + ROW * (SAMPLE_ROWS * 3)
+        stream, _ = open_decompressed(io.BytesIO(gzip.compress(data)))
+        sample, lines = read_sample(stream)
+        validate_sample(lines)
+        self.assertEqual(len(lines), SAMPLE_ROWS + 1)
+        self.assertEqual(prepend(sample, stream).read(), data)
+
+    def test_missing_columns(self):
+        self.assertCorrupt(b'device_id,timestamp\na,2024-01-01 00:00:00 UTC\n', 'Missing required columns: latitude, longitude')
+
+    def test_bad_timestamp(self):
+        self.assertCorrupt(HEADER + b'a,2024/01/01,12.5,77.1,1,1,1,1\n', "invalid timestamp '2024/01/01'")
+
+    def test_coordinates_out_of_range(self):
+        self.assertCorrupt(HEADER + b'a,2024-01-01 00:00:00 UTC,91,77.1,1,1,1,1\n', "latitude '91'")
+        self.assertCorrupt(HEADER + b'a,2024-01-01 00:00:00 UTC,12.5,-181,1,1,1,1\n', "longitude '-181'")
+        self.assertCorrupt(HEADER + b'a,2024-01-01 00:00:00 UTC,N/A,77.1,1,1,1,1\n', "latitude 'N/A'")
+
+    def test_non_utf8_input(self):
+        self.assertCorrupt(HEADER + b'\xff\xfe,2024-01-01 00:00:00 UTC,12.5,77.1,1,1,1,1\n', 'not valid UTF-8')
+
+    def test_truncated_gzip(self):
+        data = gzip.compress(HEADER + ROW * 100)
+        self.assertCorrupt(data[:len(data) // 2], 'could not be decompressed')
+
+    def test_header_longer_than_sample_budget(self):
+        self.assertCorrupt(b'x' * (MAX_SAMPLE_BYTES + 10) + b'\n' + ROW, f'longer than {MAX_SAMPLE_BYTES} bytes')
+
+    def test_wrong_field_count(self):
+        self.assertCorrupt(HEADER + b'a,1\n', 'expected 8 fields, found 2')
+
+
+class NewTaskTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.s3 = mock.Mock()
+        self.s3.generate_presigned_url.return_value = 'https://bucket.example.com/upload?X-Amz-Signature=abc'
+
+    def get(self, query=''):
+        with mock.patch('processed.views.s3_client', return_value=self.s3):
+            return self.client.get(f'/api/v1/air-quality/new-task/{query}')
+
+    def presigned_params(self):
+        return self.s3.generate_presigned_url.call_args.kwargs['Params']
+
+    def test_plain_upload(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 201)
+        params = self.presigned_params()
+        self.assertTrue(params['Key'].endswith('_unprocessed.csv'))
+        self.assertNotIn('ContentEncoding', params)
+
+    def test_compressed_upload_key_and_content_encoding(self):
+        for codec, suffix in (('gzip', '.csv.gz'), ('zstd', '.csv.zst')):
+            with self.subTest(codec=codec):
+                response = self.get(f'?compression={codec}')
+                self.assertEqual(response.status_code, 201)
+                params = self.presigned_params()
+                self.assertTrue(params['Key'].endswith(f'_unprocessed{suffix}'))
+                self.assertEqual(params['ContentEncoding'], codec)
+
+    def test_unknown_codec_is_rejected(self):
+        response = self.get('?compression=brotli')
+        self.assertEqual(response.status_code, 400)
+        self.s3.generate_presigned_url.assert_not_called()
+        self.assertFalse(ProcessedFile.objects.exists())
+
+    @mock.patch.dict(os.environ, {'AWS_S3_BUCKET_URL': 'https://bucket.example.com'})
+    def test_long_presigned_url_is_returned_but_not_stored(self):
+        presigned_url = 'https://bucket.example.com/upload?X-Amz-Security-Token=' + 'a' * 1500
+        self.s3.generate_presigned_url.return_value = presigned_url
+
+        response = self.get('?compression=gzip')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['data']['unprocessed_file_url'], presigned_url)
+        file_entry = ProcessedFile.objects.get(task_id=response.data['data']['task_id'])
+        self.assertEqual(file_entry.unprocessed_file_url, f"https://bucket.example.com/{self.presigned_params()['Key']}")
+        self.assertLessEqual(len(file_entry.unprocessed_file_url), ProcessedFile._meta.get_field('unprocessed_file_url').max_length)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Column lengths are only enforced by PostgreSQL (set DATABASE_URL)')
+class PostgresNewTaskTests(TestCase):
+
+    presigned_url = 'https://bucket.example.com/upload?X-Amz-Security-Token=' + 'a' * 1500
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+
+    def test_presigned_url_does_not_fit_the_column(self):
+        with self.assertRaises(DataError), transaction.atomic():
+            ProcessedFile.objects.create(user=self.user, task_id='task-1', unprocessed_file_url=self.presigned_url)
+
+    def test_new_task_is_created(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        s3 = mock.Mock()
+        s3.generate_presigned_url.return_value = self.presigned_url
+        with mock.patch('processed.views.s3_client', return_value=s3):
+            response = client.get('/api/v1/air-quality/new-task/?compression=zstd')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['data']['unprocessed_file_url'], self.presigned_url)
+        self.assertEqual(ProcessedFile.objects.get(task_id=response.data['data']['task_id']).status, 'Ready to Upload')
+
+
+class DownloadProcessedFileTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.data = b'device_id,pm10\na,1\n' * 1000
+
+    def download(self, file_entry, accept_encoding):
+        body = gzip.compress(self.data)
+        s3 = mock.Mock()
+        s3.get_object.return_value = {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+        with mock.patch('processed.views.s3_client', return_value=s3):
+            return self.client.get(f'/api/v1/air-quality/download-processed-file/{file_entry.task_id}/', HTTP_ACCEPT_ENCODING=accept_encoding)
+
+    def processed_entry(self):
+        return ProcessedFile.objects.create(
+            user=self.user, task_id='task-1', status='Processed',
+            unprocessed_file_url='https://bucket.example.com/task-1_unprocessed.csv',
+            processed_file_url='https://bucket.example.com/task-1_processed.csv.gz',
+        )
+
+    def test_unprocessed_task_returns_409(self):
+        file_entry = ProcessedFile.objects.create(
+            user=self.user, task_id='task-1', status='Ready to Process',
+            unprocessed_file_url='https://bucket.example.com/task-1_unprocessed.csv',
+        )
+        response = self.client.get(f'/api/v1/air-quality/download-processed-file/{file_entry.task_id}/')
+        self.assertEqual(response.status_code, 409)
+
+    def test_compressed_bytes_pass_through_when_accepted(self):
+        response = self.download(self.processed_entry(), 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.data)
+
+    def test_decompressed_server_side_when_not_accepted(self):
+        response = self.download(self.processed_entry(), 'identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+
+
+class FileStatusTests(TestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+        ProcessedFile.objects.create(
+            user=self.user, task_id='task-1', status='Processing',
+            unprocessed_file_url='https://bucket.example.com/task-1_unprocessed.csv',
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {LoginSerializerWithToken.get_token(self.user).access_token}')
+
+    def test_status_polling_skips_user_lookup(self):
+        self.client.get('/api/v1/air-quality/file-status/task-1/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/air-quality/file-status/task-1/')
+        self.assertEqual(response.data['status'], 'Processing')
+
+
+class ProcessFileTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_entry(self, status):
+        return ProcessedFile.objects.create(
+            user=self.user, task_id='task-1', status=status,
+            unprocessed_file_url='https://bucket.example.com/task-1_unprocessed.csv',
+        )
+
+    def post(self):
+        s3 = mock.Mock()
+        s3.head_object.return_value = {'ContentLength': 123}
+        with mock.patch('processed.views.s3_client', return_value=s3):
+            return self.client.post('/api/v1/air-quality/process-file/', {'task_id': 'task-1'})
+
+    def test_queues_task_for_workers(self):
+        file_entry = self.create_entry('Failed')
+        response = self.post()
+        self.assertEqual(response.status_code, 202)
+        file_entry.refresh_from_db()
+        self.assertEqual(file_entry.status, 'Ready to Process')
+        self.assertEqual(file_entry.size_bytes, 123)
+
+    def test_running_task_is_not_requeued(self):
+        self.create_entry('Processing')
+        self.assertEqual(self.post().status_code, 409)
+
+    def test_api_does_not_import_data_stack(self):
+        script = (
+            'import os, sys, django\n'
+            'os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")\n'
+            'django.setup()\n'
+            'import backend.urls\n'
+            'print(",".join(m for m in ("pandas", "numpy", "joblib", "boto3", "processed.pipeline") if m in sys.modules))\n'
+        )
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '')
+
+
+@override_settings(
+    PROCESSING_MAX_CONCURRENT_PER_USER=0, PROCESSING_QUOTA_MAX_ROWS=0, PROCESSING_QUOTA_MAX_BYTES=0,
+    PROCESSING_QUOTA_WINDOW_SECONDS=3600, PROCESSING_LEASE_SECONDS=1800,
+)
+class SchedulerTests(TestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+        self.bob = CustomUser.objects.create_user('bob', 'bob@example.com', 'password')
+
+    def create_task(self, user, status='Ready to Process', **fields):
+        count = ProcessedFile.objects.count()
+        return ProcessedFile.objects.create(
+            user=user, task_id=f'{user.username}-{count}', status=status,
+            unprocessed_file_url=f'https://bucket.example.com/{user.username}-{count}_unprocessed.csv', **fields,
+        )
+
+    def claim_owners(self, claims):
+        owners = []
+        for _ in range(claims):
+            file_entry = claim_next_task()
+            owners.append(file_entry.user.username if file_entry else None)
+        return owners
+
+    def test_weighted_round_robin(self):
+        self.alice.processing_weight = 2
+        self.alice.save()
+        for _ in range(6):
+            self.create_task(self.alice)
+        for _ in range(6):
+            self.create_task(self.bob)
+
+        self.assertEqual(self.claim_owners(6), ['alice', 'bob', 'alice', 'alice', 'bob', 'alice'])
+
+    def test_equal_weights_alternate(self):
+        for _ in range(3):
+            self.create_task(self.alice)
+        for _ in range(3):
+            self.create_task(self.bob)
+
+        self.assertEqual(self.claim_owners(4), ['alice', 'bob', 'alice', 'bob'])
+
+    def test_claims_oldest_task_and_sets_started_at(self):
+        first = self.create_task(self.alice)
+        self.create_task(self.alice)
+
+        file_entry = claim_next_task()
+        self.assertEqual(file_entry.pk, first.pk)
+        self.assertEqual(file_entry.status, 'Processing')
+        self.assertIsNotNone(file_entry.started_at)
+
+    def test_empty_queue(self):
+        self.create_task(self.alice, status='Ready to Upload')
+        self.assertIsNone(claim_next_task())
+
+    @override_settings(PROCESSING_MAX_CONCURRENT_PER_USER=2)
+    def test_concurrency_limit(self):
+        for _ in range(3):
+            self.create_task(self.alice)
+        self.create_task(self.bob)
+
+        self.assertEqual(self.claim_owners(4), ['alice', 'bob', 'alice', None])
+
+    @override_settings(PROCESSING_MAX_CONCURRENT_PER_USER=1)
+    def test_stale_tasks_are_expired_and_stop_counting(self):
+        stale = self.create_task(self.alice, status='Processing', started_at=timezone.now() - timedelta(hours=1))
+        self.create_task(self.alice)
+
+        self.assertEqual(self.claim_owners(1), ['alice'])
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'Failed')
+        self.assertTrue(stale.errors)
+
+    @override_settings(PROCESSING_MAX_CONCURRENT_PER_USER=1)
+    def test_heartbeat_keeps_long_running_task_alive(self):
+        long_running = self.create_task(
+            self.alice, status='Processing', started_at=timezone.now() - timedelta(hours=1), heartbeat_at=timezone.now(),
+        )
+        self.create_task(self.alice)
+
+        self.assertEqual(self.claim_owners(1), [None])
+        long_running.refresh_from_db()
+        self.assertEqual(long_running.status, 'Processing')
+
+    def test_lease_is_only_renewed_by_its_owner(self):
+        self.create_task(self.alice)
+        file_entry = claim_next_task()
+        self.assertTrue(renew_lease(file_entry))
+
+        # The task was expired, requeued and claimed again by another worker.
+        ProcessedFile.objects.filter(pk=file_entry.pk).update(started_at=timezone.now() + timedelta(seconds=1))
+
+        self.assertFalse(renew_lease(file_entry))
+        self.assertFalse(finish_task(file_entry, status='Processed'))
+        self.assertEqual(ProcessedFile.objects.get(pk=file_entry.pk).status, 'Processing')
+
+    @override_settings(PROCESSING_QUOTA_MAX_ROWS=100)
+    def test_row_quota(self):
+        self.create_task(self.alice, status='Processed', started_at=timezone.now(), row_count=100)
+        self.create_task(self.alice)
+        self.create_task(self.bob)
+
+        self.assertEqual(self.claim_owners(2), ['bob', None])
+
+    @override_settings(PROCESSING_QUOTA_MAX_ROWS=100)
+    def test_row_quota_resets_after_window(self):
+        self.create_task(self.alice, status='Processed', started_at=timezone.now() - timedelta(hours=2), row_count=100)
+        self.create_task(self.alice)
+
+        self.assertEqual(self.claim_owners(1), ['alice'])
+
+    @override_settings(PROCESSING_QUOTA_MAX_BYTES=1000)
+    def test_byte_quota(self):
+        self.create_task(self.alice, status='Processed', started_at=timezone.now(), size_bytes=900)
+        self.create_task(self.alice, size_bytes=200)
+        self.create_task(self.bob, size_bytes=5000)
+
+        # Bob has used nothing, so his oversized file may still run; Alice's would overflow.
+        self.assertEqual(self.claim_owners(2), ['bob', None])
+
+    @override_settings(PROCESSING_MAX_CONCURRENT_PER_USER=2, PROCESSING_QUOTA_MAX_ROWS=100, PROCESSING_QUOTA_MAX_BYTES=1000)
+    def test_has_capacity(self):
+        self.assertTrue(has_capacity(EMPTY_USAGE, 5000))
+        self.assertFalse(has_capacity(dict(EMPTY_USAGE, running=2)))
+        self.assertFalse(has_capacity(dict(EMPTY_USAGE, rows=100)))
+        self.assertTrue(has_capacity(dict(EMPTY_USAGE, bytes=900), 100))
+        self.assertFalse(has_capacity(dict(EMPTY_USAGE, bytes=900), 101))
+
+
+def create_task(user, task_id, status='Ready to Process', **fields):
+    return ProcessedFile.objects.create(
+        user=user, task_id=task_id, status=status,
+        unprocessed_file_url=f'https://bucket.example.com/{task_id}_unprocessed.csv', **fields,
+    )
+
+
+class TaskLeaseTests(SimpleTestCase):
+
+    def test_lease_is_renewed_until_it_is_lost(self):
+        renewals = iter([True, True, False])
+        with mock.patch('processed.scheduler.renew_lease', side_effect=lambda file_entry: next(renewals)) as renew:
+            with TaskLease(mock.Mock(), interval=0.01) as lease:
+                lease._thread.join(timeout=5)
+
+        self.assertTrue(lease.lost)
+        self.assertEqual(renew.call_count, 3)
+
+    def test_database_errors_do_not_stop_renewals(self):
+        renewals = iter([DatabaseError('connection lost'), False])
+
+        def renew(file_entry):
+            result = next(renewals)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with mock.patch('processed.scheduler.renew_lease', side_effect=renew):
+            with TaskLease(mock.Mock(), interval=0.01) as lease:
+                lease._thread.join(timeout=5)
+
+        self.assertTrue(lease.lost)
+
+
+class ClaimOldestTaskTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+
+    def test_claims_oldest_by_created_at(self):
+        newer = create_task(self.user, 'newer')
+        older = create_task(self.user, 'older')
+        ProcessedFile.objects.filter(pk=older.pk).update(created_at=newer.created_at - timedelta(minutes=1))
+
+        self.assertEqual(claim_oldest_task(self.user.id).pk, older.pk)
+        self.assertEqual(claim_oldest_task(self.user.id).pk, newer.pk)
+        self.assertIsNone(claim_oldest_task(self.user.id))
+
+    def test_only_claims_ready_tasks_of_that_user(self):
+        other = CustomUser.objects.create_user('bob', 'bob@example.com', 'password')
+        create_task(self.user, 'uploading', status='Ready to Upload')
+        create_task(other, 'other')
+
+        self.assertIsNone(claim_oldest_task(self.user.id))
+
+
+@override_settings(PROCESSED_FILE_ARCHIVE_AFTER_DAYS=30)
+class ArchiveTasksTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+        self.old = timezone.now() - timedelta(days=31)
+
+    def create_old_task(self, task_id, status='Processed'):
+        file_entry = create_task(self.user, task_id, status=status, processed_file_url=f'https://bucket.example.com/{task_id}_processed.csv', row_count=10)
+        ProcessedFile.objects.filter(pk=file_entry.pk).update(created_at=self.old)
+        return file_entry
+
+    def test_moves_old_finished_tasks_in_batches(self):
+        for index in range(5):
+            self.create_old_task(f'done-{index}')
+        self.create_old_task('failed', status='Failed')
+        self.create_old_task('queued', status='Ready to Process')
+        create_task(self.user, 'recent', status='Processed')
+
+        call_command('archive_tasks', batch_size=2, stdout=io.StringIO())
+
+        self.assertEqual(set(ProcessedFile.objects.values_list('task_id', flat=True)), {'queued', 'recent'})
+        self.assertEqual(ArchivedProcessedFile.objects.count(), 6)
+        archived = ArchivedProcessedFile.objects.get(task_id='done-0')
+        self.assertEqual((archived.user_id, archived.status, archived.row_count, archived.created_at), (self.user.id, 'Processed', 10, self.old))
+
+    def test_task_already_in_archive_is_kept(self):
+        self.create_old_task('duplicate')
+        self.create_old_task('other')
+        ArchivedProcessedFile.objects.create(
+            user=self.user, task_id='duplicate', status='Failed', unprocessed_file_url='https://bucket.example.com/x',
+            created_at=self.old, updated_at=self.old,
+        )
+
+        call_command('archive_tasks', stdout=io.StringIO())
+
+        self.assertTrue(ProcessedFile.objects.filter(task_id='duplicate').exists())
+        self.assertTrue(ArchivedProcessedFile.objects.filter(task_id='other').exists())
+
+    def test_archived_task_ids_are_excluded_with_an_anti_join(self):
+        self.create_old_task('done')
+        with CaptureQueriesContext(connection) as queries:
+            call_command('archive_tasks', stdout=io.StringIO())
+
+        select = next(query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'processed_processedfile' in query['sql'])
+        self.assertIn('NOT EXISTS', select)
+        self.assertNotIn('NOT IN', select)
+
+    def test_archived_tasks_remain_visible(self):
+        self.create_old_task('done')
+        call_command('archive_tasks', stdout=io.StringIO())
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/v1/air-quality/file-status/done/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'Processed')
+
+        body = b'device_id\na\n'
+        s3 = mock.Mock()
+        s3.get_object.return_value = {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+        with mock.patch('processed.views.s3_client', return_value=s3):
+            response = client.get('/api/v1/air-quality/download-processed-file/done/')
+        self.assertEqual(b''.join(response.streaming_content), body)
+
+
+class ProcessFilesCommandTests(SimpleTestCase):
+
+    def test_database_error_while_claiming_does_not_stop_worker(self):
+        pipeline = mock.Mock()
+        claims = mock.Mock(side_effect=[DatabaseError('server closed the connection'), None])
+        with mock.patch.dict(sys.modules, {'processed.pipeline': pipeline}), \
+                mock.patch('processed.management.commands.process_files.claim_next_task', claims), \
+                mock.patch('processed.management.commands.process_files.close_old_connections') as close_old_connections:
+            stderr = io.StringIO()
+            call_command('process_files', once=True, interval=0, stdout=io.StringIO(), stderr=stderr)
+
+        self.assertEqual(claims.call_count, 2)
+        self.assertEqual(close_old_connections.call_count, 2)
+        self.assertIn('server closed the connection', stderr.getvalue())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SKIP LOCKED claiming needs PostgreSQL (set DATABASE_URL)')
+class ConcurrentClaimTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+        self.tasks = [create_task(self.user, f'task-{index}') for index in range(20)]
+
+    def in_thread(self, target):
+        def run():
+            try:
+                target()
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_locked_row_is_skipped(self):
+        claimed = []
+        with transaction.atomic():
+            locked = ProcessedFile.objects.select_for_update().get(pk=self.tasks[0].pk)
+            self.in_thread(lambda: claimed.append(claim_oldest_task(self.user.id))).join()
+
+        self.assertEqual(claimed[0].pk, self.tasks[1].pk)
+        locked.refresh_from_db()
+        self.assertEqual(locked.status, 'Ready to Process')
+
+    def test_concurrent_claimers_never_share_a_row(self):
+        barrier = threading.Barrier(4)
+        claimed = []
+
+        def claimer():
+            barrier.wait()
+            while True:
+                file_entry = claim_oldest_task(self.user.id)
+                if file_entry is None:
+                    return
+                claimed.append(file_entry.pk)
+
+        for thread in [self.in_thread(claimer) for _ in range(4)]:
+            thread.join()
+
+        self.assertEqual(sorted(claimed), sorted(task.pk for task in self.tasks))
+
+
+class PipelineTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+        self.file_entry = create_task(self.user, 'task-1', status='Processing', started_at=timezone.now())
+        self.uploads = {}
+
+    def upload_file(self, path, bucket, key, ExtraArgs):
+        with open(path, 'rb') as local_file:
+            self.uploads[key] = {'data': local_file.read(), 'extra_args': ExtraArgs, 'path': path}
+
+    def run_pipeline(self, body, upload_file=None):
+        from . import pipeline
+
+        s3 = mock.Mock()
+        s3.get_object.return_value = {'Body': io.BytesIO(body)}
+        s3.upload_file.side_effect = upload_file or self.upload_file
+        self.model = mock.Mock()
+        self.model.predict.side_effect = lambda x: [[0.0, 0.0, 0.0, 0.0]] * len(x)
+        self.get_model = mock.Mock(return_value=self.model)
+        with mock.patch.object(pipeline, 's3_client', return_value=s3), \
+                mock.patch.object(pipeline, 'get_model', self.get_model):
+            return pipeline.process_task(self.file_entry)
+
+    def test_corrupt_upload_is_rejected_before_parsing(self):
+        from . import pipeline
+
+        with mock.patch.object(pipeline.pd, 'read_csv') as read_csv, self.assertRaises(CorruptFileError):
+            self.run_pipeline(HEADER + b'a,2024/01/01,120,77.1,1,1,1,1\n')
+
+        read_csv.assert_not_called()
+        self.get_model.assert_not_called()
+        self.assertEqual(self.uploads, {})
+        self.file_entry.refresh_from_db()
+        self.assertEqual(self.file_entry.status, 'Corrupted')
+        self.assertEqual(len(self.file_entry.errors), 2)
+        self.assertIn("invalid timestamp '2024/01/01'", self.file_entry.errors[0])
+        self.assertIn("latitude '120'", self.file_entry.errors[1])
+
+    def test_other_errors_mark_task_failed(self):
+        with self.assertRaises(OSError):
+            self.run_pipeline(HEADER + ROW, upload_file=mock.Mock(side_effect=OSError('connection reset')))
+
+        self.file_entry.refresh_from_db()
+        self.assertEqual(self.file_entry.status, 'Failed')
+        self.assertEqual(self.file_entry.errors, ['connection reset'])
+
+    def take_over_task(self):
+        """Simulate the task being expired, requeued and claimed by another worker."""
+        ProcessedFile.objects.filter(pk=self.file_entry.pk).update(
+            status='Processing', started_at=timezone.now() + timedelta(seconds=1),
+        )
+
+    def test_result_is_discarded_when_lease_was_lost_during_upload(self):
+        def upload_file(*args, **kwargs):
+            self.upload_file(*args, **kwargs)
+            self.take_over_task()
+
+        with self.assertRaises(LeaseLost):
+            self.run_pipeline(HEADER + ROW * 10, upload_file=upload_file)
+
+        task = ProcessedFile.objects.get(pk=self.file_entry.pk)
+        self.assertEqual(task.status, 'Processing')
+        self.assertIsNone(task.processed_file_url)
+        self.assertIsNone(task.row_count)
+
+    def test_upload_is_skipped_when_lease_was_lost(self):
+        from . import pipeline
+
+        preprocess_data = pipeline.preprocess_data
+        with mock.patch.object(pipeline, 'preprocess_data', side_effect=lambda df: self.take_over_task() or preprocess_data(df)):
+            with self.assertRaises(LeaseLost):
+                self.run_pipeline(HEADER + ROW * 10)
+
+        self.assertEqual(self.uploads, {})
+        self.assertEqual(ProcessedFile.objects.get(pk=self.file_entry.pk).status, 'Processing')
+
+    def test_failure_is_not_recorded_when_lease_was_lost(self):
+        def upload_file(*args, **kwargs):
+            self.take_over_task()
+            raise OSError('connection reset')
+
+        with self.assertRaises(OSError):
+            self.run_pipeline(HEADER + ROW * 10, upload_file=upload_file)
+
+        task = ProcessedFile.objects.get(pk=self.file_entry.pk)
+        self.assertEqual(task.status, 'Processing')
+        self.assertIsNone(task.errors)
+
+    def test_padded_header_names_are_processed(self):
+        padded = b', '.join(HEADER.split(b',')).replace(b'device_id', b' device_id ')
+        self.run_pipeline(padded + ROW * 10)
+
+        self.file_entry.refresh_from_db()
+        self.assertEqual(self.file_entry.status, 'Processed')
+        self.assertProcessedCsv(gzip.decompress(self.uploads['task-1_processed.csv.gz']['data']))
+
+    def test_processed_file_is_written_to_a_temporary_directory(self):
+        self.run_pipeline(HEADER + ROW * 10)
+
+        upload = self.uploads['task-1_processed.csv.gz']
+        self.assertNotEqual(os.path.dirname(upload['path']), os.getcwd())
+        self.assertFalse(os.path.exists(upload['path']))
+        self.assertFalse(os.path.exists('task-1_processed.csv.gz'))
+
+    def assertProcessedCsv(self, data):
+        from . import pipeline
+
+        df = pipeline.pd.read_csv(io.BytesIO(data))
+        self.assertEqual(list(df.columns), ['device_id', 'latitude', 'longitude', 'humidity', 'temperature', 'pm10', 'pm2_5', 'unix_timestamp'])
+        self.assertEqual(len(df), 10)
+        self.assertFalse(df.isnull().any().any())
+
+    @override_settings(PROCESSED_FILE_CODEC='gzip', PROCESSED_FILE_COMPRESSION_LEVEL=9)
+    def test_gzip_output(self):
+        self.run_pipeline(HEADER + ROW * 10)
+
+        upload = self.uploads['task-1_processed.csv.gz']
+        self.assertEqual(upload['extra_args'], {'ContentType': 'text/csv', 'ContentEncoding': 'gzip'})
+        # Byte 8 of a gzip header (XFL) is 2 when the stream was written at the maximum level.
+        self.assertEqual(upload['data'][8], 2)
+        self.assertProcessedCsv(gzip.decompress(upload['data']))
+        self.file_entry.refresh_from_db()
+        self.assertEqual(self.file_entry.status, 'Processed')
+        self.assertEqual(self.file_entry.processed_file_url.rsplit('/', 1)[-1], 'task-1_processed.csv.gz')
+
+    @override_settings(PROCESSED_FILE_CODEC='zstd', PROCESSED_FILE_COMPRESSION_LEVEL=3)
+    def test_zstd_input_and_output(self):
+        import zstandard
+
+        self.run_pipeline(zstandard.ZstdCompressor().compress(HEADER + ROW * 10))
+
+        upload = self.uploads['task-1_processed.csv.zst']
+        self.assertEqual(upload['extra_args'], {'ContentType': 'text/csv', 'ContentEncoding': 'zstd'})
+        self.assertProcessedCsv(zstandard.ZstdDecompressor().stream_reader(io.BytesIO(upload['data'])).read())
+
+    @override_settings(PROCESSED_FILE_CODEC='none')
+    def test_uncompressed_output(self):
+        self.run_pipeline(gzip.compress(HEADER + ROW * 10))
+
+        upload = self.uploads['task-1_processed.csv']
+        self.assertEqual(upload['extra_args'], {'ContentType': 'text/csv'})
+        self.assertProcessedCsv(upload['data'])
+
+    def test_temporary_file_is_removed_when_upload_fails(self):
+        paths = []
+
+        def failing_upload(path, bucket, key, ExtraArgs):
+            paths.append(path)
+            raise OSError('connection reset')
+
+        with self.assertRaises(OSError):
+            self.run_pipeline(HEADER + ROW * 10, upload_file=failing_upload)
+        self.assertFalse(os.path.exists(paths[0]))
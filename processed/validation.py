@@ -0,0 +1,115 @@
+"""
+Cheap pre-flight checks run on the head of an upload before the full parse.
+
+Only the header and the first SAMPLE_ROWS rows are read, so a corrupt file is
+rejected after a few kilobytes instead of after parsing, preprocessing and
+model loading.
+"""
+import csv
+import math
+from datetime import datetime
+
+from .compression import decompression_errors
+
+REQUIRED_COLUMNS = ['device_id', 'timestamp', 'latitude', 'longitude', 'humidity', 'temperature', 'pm10', 'pm2_5']
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S UTC"
+COORDINATE_RANGES = {
+    'latitude': (-90.0, 90.0),
+    'longitude': (-180.0, 180.0),
+}
+
+SAMPLE_ROWS = 1000
+MAX_SAMPLE_BYTES = 1024 * 1024
+MAX_REASONS = 20
+
+
+class CorruptFileError(Exception):
+    """Raised when an upload fails pre-flight validation."""
+
+    def __init__(self, reasons):
+        self.reasons = reasons
+        super().__init__('; '.join(reasons))
+
+
+def read_sample(stream, rows=SAMPLE_ROWS, max_bytes=MAX_SAMPLE_BYTES):
+    """
+    Read the header plus up to `rows` lines from a binary stream.
+
+    Returns the raw bytes consumed so the caller can replay them in front of
+    the rest of the stream for the full parse.
+    """
+    lines = []
+    size = 0
+    try:
+        while len(lines) <= rows and size < max_bytes:
+            line = stream.readline(max_bytes - size)
+            if not line:
+                break
+            lines.append(line)
+            size += len(line)
+    except decompression_errors() as e:
+        raise CorruptFileError([f'File could not be decompressed: {e}'])
+
+    # A line cut off by the byte budget is not a complete row; leave it out of the checks.
+    sample = b''.join(lines)
+    if size >= max_bytes and lines and not lines[-1].endswith(b'\n'):
+        if len(lines) == 1:
+            raise CorruptFileError([f'Header row is longer than {max_bytes} bytes'])
+        return sample, lines[:-1]
+    return sample, lines
+
+def _check_timestamp(value):
+    try:
+        datetime.strptime(value, TIMESTAMP_FORMAT)
+        return True
+    except ValueError:
+        return False
+
+def _check_coordinate(value, low, high):
+    try:
+        number = float(value)
+    except ValueError:
+        return False
+    return math.isfinite(number) and low <= number <= high
+
+def validate_sample(lines):
+    """Validate sampled csv lines, raising CorruptFileError with every reason found."""
+    try:
+        text = [line.decode('utf-8-sig' if index == 0 else 'utf-8') for index, line in enumerate(lines)]
+    except UnicodeDecodeError:
+        raise CorruptFileError(['File is not valid UTF-8 text'])
+
+    try:
+        records = list(csv.reader(text))
+    except csv.Error as e:
+        raise CorruptFileError([f'Malformed csv: {e}'])
+
+    if not records or not any(field.strip() for field in records[0]):
+        raise CorruptFileError(['File is empty or has no header row'])
+
+    header = [field.strip() for field in records[0]]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise CorruptFileError([f"Missing required columns: {', '.join(missing)}"])
+
+    rows = [(line_number, row) for line_number, row in enumerate(records[1:], start=2) if row]
+    if not rows:
+        raise CorruptFileError(['File has no data rows'])
+
+    reasons = []
+    index = {column: header.index(column) for column in REQUIRED_COLUMNS}
+    for line_number, row in rows:
+        if len(reasons) >= MAX_REASONS:
+            break
+        if len(row) != len(header):
+            reasons.append(f'Line {line_number}: expected {len(header)} fields, found {len(row)}')
+            continue
+        if not _check_timestamp(row[index['timestamp']]):
+            reasons.append(f"Line {line_number}: invalid timestamp '{row[index['timestamp']]}', expected {TIMESTAMP_FORMAT}")
+        for column, (low, high) in COORDINATE_RANGES.items():
+            value = row[index[column]]
+            if not _check_coordinate(value, low, high):
+                reasons.append(f"Line {line_number}: {column} '{value}' is not a number between {low:g} and {high:g}")
+
+    if reasons:
+        raise CorruptFileError(reasons[:MAX_REASONS])
@@ -1,59 +1,96 @@
 import uuid
-import boto3
-import pandas as pd
-import numpy as np
-from joblib import load
-from datetime import datetime
-from django.http import HttpResponse
-from rest_framework.decorators import api_view
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .models import ProcessedFile
-from .serializers import ProcessedFileSerializer
-import os
+from .models import ProcessedFile, ArchivedProcessedFile
+from .serializers import ProcessedFileSerializer, ArchivedProcessedFileSerializer
+from .aws import s3_client, bucket_name, bucket_url
+from .compression import (
+    validate_codec, key_from_url, codec_from_key, unprocessed_file_key,
+    content_encoding, accepts_encoding, open_decompressed, iter_stream,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Create your views here.
 
+# Tasks in these states can be (re)queued for the process_files workers.
+QUEUEABLE_STATUSES = ['Ready to Upload', 'Ready to Process', 'Failed']
+
 def generate_task_id():
     return str(uuid.uuid4())
 
+def find_task(task_id, user_id):
+    """Look a task up in the hot table, falling back to the archive for old finished tasks."""
+    try:
+        return ProcessedFile.objects.get(task_id=task_id, user_id=user_id)
+    except ProcessedFile.DoesNotExist:
+        pass
+    try:
+        return ArchivedProcessedFile.objects.get(task_id=task_id, user_id=user_id)
+    except ArchivedProcessedFile.DoesNotExist:
+        raise ProcessedFile.DoesNotExist
+
+def queue_for_processing(file_entry):
+    # Record the upload size so the scheduler can enforce per-user byte quotas.
+    head = s3_client().head_object(Bucket=bucket_name(), Key=key_from_url(file_entry.unprocessed_file_url))
+    file_entry.size_bytes = head['ContentLength']
+    file_entry.status = 'Ready to Process'
+    file_entry.errors = None
+    file_entry.save(update_fields=['size_bytes', 'status', 'errors'])
+
 @api_view(['GET'])
+@permission_classes((IsAuthenticated,))
 def new_task(request):
     """
     @desc     Create a new task and return presigned URL for direct upload to S3
-    @route    GET /api/v1/air-quality/new-task
+    @route    GET /api/v1/air-quality/new-task?compression={none|gzip|zstd}
     @access   Private
     @return   Json
     """
+    try:
+        codec = validate_codec(request.query_params.get('compression'))
+    except ValueError as e:
+        return Response({'message': str(e)}, status=400)
+
     try:
         task_id = generate_task_id()
+        key = unprocessed_file_key(task_id, codec)
+
+        params = {
+            'Bucket': bucket_name(),
+            'Key': key,
+            'ContentType': 'text/csv'
+        }
+        if content_encoding(codec):
+            params['ContentEncoding'] = content_encoding(codec)
 
-        s3 = boto3.client('s3', region_name=os.environ.get('AWS_S3_REGION_NAME'))
-        presigned_url = s3.generate_presigned_url(
+        presigned_url = s3_client().generate_presigned_url(
             'put_object',
-            Params={
-                'Bucket': os.environ.get('AWS_STORAGE_BUCKET_NAME'),
-                'Key': f"{task_id}_unprocessed.csv",
-                'ContentType': 'text/csv'
-            },
+            Params=params,
             ExpiresIn=30000,
         )
 
+        # Presigned URLs (especially with session credentials) are far longer than the
+        # column allows, so store the object's URL and only hand the signed one back.
         file_entry = ProcessedFile.objects.create(
-            unprocessed_file_url=presigned_url,
+            user_id=request.user.id,
+            unprocessed_file_url=bucket_url(key),
             task_id=task_id,
             status='Ready to Upload'
         )
 
-        serializer = ProcessedFileSerializer(file_entry)
-        return Response({'message': 'Presigned URL generated successfully', 'data': serializer.data}, status=201)
+        data = ProcessedFileSerializer(file_entry).data
+        data['unprocessed_file_url'] = presigned_url
+        return Response({'message': 'Presigned URL generated successfully', 'data': data}, status=201)
 
     except Exception as e:
         return Response({'message': 'Failed to generate presigned URL', 'error': str(e)}, status=500)
 
 @api_view(['POST'])
+@permission_classes((IsAuthenticated,))
 def mark_upload_complete(request):
     """
     @desc     Mark unprocessed file as ready to process after direct upload to S3
@@ -63,10 +100,11 @@ def mark_upload_complete(request):
     """
     task_id = request.data.get('task_id')
     try:
+        file_entry = ProcessedFile.objects.get(task_id=task_id, user_id=request.user.id)
+        if file_entry.status not in QUEUEABLE_STATUSES:
+            return Response({'message': f'File cannot be queued while {file_entry.status}'}, status=409)
 
-        file_entry = ProcessedFile.objects.get(task_id=task_id)
-        file_entry.status = 'Ready to Process'
-        file_entry.save()
+        queue_for_processing(file_entry)
 
         serializer = ProcessedFileSerializer(file_entry)
         return Response({'message': 'File marked as ready to process', 'data': serializer.data}, status=200)
@@ -77,71 +115,35 @@ def mark_upload_complete(request):
     except Exception as e:
         return Response({'message': 'Failed to mark file as ready to process', 'error': str(e)}, status=500)
 
-# Helper functions for preprocessing
-def time_stamp_to_unix(datetime_str):
-    datetime_object = datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S UTC")
-    return int(datetime_object.timestamp())
-
-def preprocess_data(df):
-    df['unix_timestamp'] = df['timestamp'].apply(time_stamp_to_unix)
-    df.replace({'N/A': np.nan, 'Null': np.nan, 0: np.nan}, inplace=True)
-    df.sort_values(by=['device_id', 'unix_timestamp'], inplace=True)
-
-    return df.drop(columns=['timestamp'])
-
 @api_view(['POST'])
+@permission_classes((IsAuthenticated,))
 def process_file(request):
-
     """
-    @desc     Process unprocessed file and upload processed file to S3
+    @desc     Queue unprocessed file for the processing workers (manage.py process_files)
     @route    POST /api/v1/air-quality/process-file
     @access   Private
     @return   Json
     """
-        
     task_id = request.data.get('task_id')
     try:
-        file_entry = ProcessedFile.objects.get(task_id=task_id)
-        unprocessed_file_url = f"{os.environ.get('AWS_S3_BUCKET_URL')}/{task_id}_unprocessed.csv"
-
-        df = pd.read_csv(unprocessed_file_url)
-        df = preprocess_data(df)
-
-        model = load('air_quality_rf_model.joblib')
-
-        missing_indices = df[df.isnull().any(axis=1)].index
-
-        if not missing_indices.empty:
-            x_missing = df.loc[missing_indices, ['unix_timestamp', 'latitude', 'longitude']]
-            df.loc[missing_indices, ['humidity', 'temperature', 'pm10', 'pm2_5']] = model.predict(x_missing)
-
-        processed_file_path = f'{task_id}_processed.csv'
-        df.to_csv(processed_file_path, index=False)
+        file_entry = ProcessedFile.objects.get(task_id=task_id, user_id=request.user.id)
+        if file_entry.status not in QUEUEABLE_STATUSES:
+            return Response({'message': f'File cannot be queued while {file_entry.status}'}, status=409)
 
-        s3 = boto3.client('s3', region_name=os.environ.get('AWS_S3_REGION_NAME'))
-        response = s3.upload_file(processed_file_path, os.environ.get('AWS_STORAGE_BUCKET_NAME'), processed_file_path)
-        processed_file_url = f"{os.environ.get('AWS_S3_BUCKET_URL')}/{processed_file_path}"
+        if file_entry.status != 'Ready to Process':
+            queue_for_processing(file_entry)
 
-        file_entry.processed_file_url = processed_file_url
-        file_entry.status = 'Processed'
-        file_entry.save()
-
-        return Response({
-            'message': 'File processed successfully',
-            'data': {
-                'unprocessed_file_url': unprocessed_file_url,
-                'processed_file_url': processed_file_url
-            }
-        }, status=200)
+        serializer = ProcessedFileSerializer(file_entry)
+        return Response({'message': 'File queued for processing', 'data': serializer.data}, status=202)
 
     except ProcessedFile.DoesNotExist:
         return Response({'message': 'File not found'}, status=404)
     except Exception as e:
-        print(e)
-        return Response({'message': f'Failed to process file: {str(e)}'}, status=500)
+        return Response({'message': 'Failed to queue file for processing', 'error': str(e)}, status=500)
 
 @api_view(['GET'])
-def file_status(request):
+@permission_classes((IsAuthenticated,))
+def file_status(request, task_id):
     """
     @desc     Get the status of a processed file
     @route    GET /api/v1/air-quality/file-status/{task_id}
@@ -149,10 +151,12 @@ def file_status(request):
     @return   Json
     """
     try:
-        task_id = request.task_id
-        file_entry = ProcessedFile.objects.get(task_id=task_id)
+        file_entry = find_task(task_id, request.user.id)
 
-        serializer = ProcessedFileSerializer(file_entry)
+        if isinstance(file_entry, ArchivedProcessedFile):
+            serializer = ArchivedProcessedFileSerializer(file_entry)
+        else:
+            serializer = ProcessedFileSerializer(file_entry)
         return Response({'status': file_entry.status, 'data': serializer.data}, status=200)
 
     except ProcessedFile.DoesNotExist:
@@ -162,23 +166,35 @@ def file_status(request):
         return Response({'message': 'Failed to retrieve file status', 'error': str(e)}, status=500)
 
 @api_view(['GET'])
-def download_processed_file(request):
+@permission_classes((IsAuthenticated,))
+def download_processed_file(request, task_id):
     """
     @desc     Download the processed file
     @route    GET /api/v1/air-quality/download-processed-file/{task_id}
     @access   Private
-    @return   HttpResponse
+    @return   StreamingHttpResponse
     """
     try:
-        task_id = request.task_id
-
-        file_entry = ProcessedFile.objects.get(ask_id=task_id)
-        processed_file_url = file_entry.processed_file_url
-
-        s3 = boto3.client('s3', region_name=os.environ.get('AWS_S3_REGION_NAME'))
-        response = HttpResponse(content_type='text/csv')
+        file_entry = find_task(task_id, request.user.id)
+        if not file_entry.processed_file_url:
+            return Response({'message': 'File has not been processed yet', 'status': file_entry.status}, status=409)
+
+        processed_key = key_from_url(file_entry.processed_file_url)
+        codec = codec_from_key(processed_key)
+        s3_object = s3_client().get_object(Bucket=bucket_name(), Key=processed_key)
+
+        # Send compressed bytes as-is when the client can decode them, otherwise decompress
+        # here. Either way the file is streamed through in chunks rather than buffered.
+        if accepts_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), codec):
+            response = StreamingHttpResponse(iter_stream(s3_object['Body']), content_type='text/csv')
+            response['Content-Length'] = s3_object['ContentLength']
+            if content_encoding(codec):
+                response['Content-Encoding'] = content_encoding(codec)
+        else:
+            stream, _ = open_decompressed(s3_object['Body'], processed_key)
+            response = StreamingHttpResponse(iter_stream(stream), content_type='text/csv')
         response['Content-Disposition'] = f'attachment; filename="{task_id}_processed.csv"'
-        s3.download_fileobj('your-s3-bucket', processed_file_url, response)
+        response['Vary'] = 'Accept-Encoding'
 
         return response
 
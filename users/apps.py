@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete
+        from .authentication import user_cache
+        from .models import CustomUser
+
+        def drop_cached_user(sender, instance, **kwargs):
+            user_cache.discard(instance.pk)
+
+        post_save.connect(drop_cached_user, sender=CustomUser, weak=False)
+        post_delete.connect(drop_cached_user, sender=CustomUser, weak=False)
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+# Immutable account state cached per user; everything else comes from the token.
+AccountSnapshot = namedtuple('AccountSnapshot', ['is_active', 'is_staff', 'is_superuser'])
+
+
+class TTLUserCache:
+    """Small thread-safe LRU cache whose entries expire after `ttl` seconds. Values must be immutable."""
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = TTLUserCache(settings.JWT_USER_CACHE_TTL, settings.JWT_USER_CACHE_SIZE)
+
+
+class CachedTokenUser(TokenUser):
+    """
+    Per-request user built from the token's `user_id` and `username` claims.
+
+    Account flags come from a cached AccountSnapshot. Views that need the full
+    profile (e.g. the email) load the CustomUser themselves.
+    """
+
+    def __init__(self, token, account):
+        super().__init__(token)
+        self.is_active = account.is_active
+        self.is_staff = account.is_staff
+        self.is_superuser = account.is_superuser
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the identity claims embedded in the token.
+
+    The account is looked up in the database at most once per JWT_USER_CACHE_TTL
+    seconds per process, to confirm it still exists and is active. Only an
+    immutable snapshot of its flags is cached, and each request gets its own
+    CachedTokenUser, so requests never share a mutable user object. Saving a
+    user drops their cache entry, so deactivation takes effect immediately in
+    that process and within the TTL elsewhere.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        account = user_cache.get(user_id)
+        if account is None:
+            user = super().get_user(validated_token)
+            account = AccountSnapshot(user.is_active, user.is_staff, user.is_superuser)
+            user_cache.set(user_id, account)
+        return CachedTokenUser(validated_token, account)
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='processing_weight',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
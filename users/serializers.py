@@ -49,7 +49,8 @@ class LoginSerializerWithToken(TokenObtainPairSerializer):
     def validate(self, attrs):
         data = super().validate(attrs)
 
-        serializer = UserSerializerWithToken(self.user).data
+        # Reuse the pair minted by super().validate instead of signing new tokens.
+        serializer = UserSerializerWithToken(self.user, context={'refresh': data['refresh'], 'access': data['access']}).data
         for k, v in serializer.items():
             data[k] = v
 
@@ -75,6 +76,9 @@ class UserSerializerWithToken(UserSerializer):
         exclude = ['id']
 
     def get_access(self, obj):
+        if 'access' in self.context:
+            return self.context['access']
+
         token = RefreshToken.for_user(obj)
 
         token['username'] = obj.username
@@ -82,5 +86,8 @@ class UserSerializerWithToken(UserSerializer):
         return str(token.access_token)
     
     def get_refresh(self, obj):
+        if 'refresh' in self.context:
+            return self.context['refresh']
+
         token = RefreshToken.for_user(obj)
         return str(token)
\ No newline at end of file
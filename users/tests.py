@@ -1,3 +1,88 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .authentication import AccountSnapshot, CachedJWTAuthentication, CachedTokenUser, TTLUserCache, user_cache
+from .models import CustomUser
+from .serializers import LoginSerializerWithToken
+
+
+class TTLUserCacheTests(SimpleTestCase):
+
+    def test_entries_expire_after_ttl(self):
+        cache = TTLUserCache(ttl=60, maxsize=10)
+        with mock.patch('users.authentication.time.monotonic', return_value=100):
+            cache.set(1, 'account')
+        with mock.patch('users.authentication.time.monotonic', return_value=159):
+            self.assertEqual(cache.get(1), 'account')
+        with mock.patch('users.authentication.time.monotonic', return_value=161):
+            self.assertIsNone(cache.get(1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLUserCache(ttl=60, maxsize=2)
+        cache.set(1, 'one')
+        cache.set(2, 'two')
+        cache.get(1)
+        cache.set(3, 'three')
+
+        self.assertEqual(cache.get(1), 'one')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), 'three')
+
+
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+        self.authentication = CachedJWTAuthentication()
+
+    def authenticate(self):
+        access = LoginSerializerWithToken.get_token(self.user).access_token
+        return self.authentication.get_user(self.authentication.get_validated_token(str(access)))
+
+    def test_user_is_built_from_claims_and_cached(self):
+        with self.assertNumQueries(1):
+            first = self.authenticate()
+        with self.assertNumQueries(0):
+            second = self.authenticate()
+
+        self.assertIsInstance(first, CachedTokenUser)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.id, self.user.id)
+        self.assertEqual(second.username, 'alice')
+        self.assertTrue(second.is_authenticated)
+
+    def test_saving_user_drops_cache_entry(self):
+        self.authenticate()
+        self.assertEqual(user_cache.get(self.user.id), AccountSnapshot(True, False, False))
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(user_cache.get(self.user.id))
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleting_user_drops_cache_entry(self):
+        self.authenticate()
+        self.user.delete()
+        self.assertIsNone(user_cache.get(self.user.id))
+
+
+class LoginTests(TestCase):
+
+    def setUp(self):
+        CustomUser.objects.create_user('alice', 'alice@example.com', 'password')
+
+    def test_login_mints_one_token_pair(self):
+        with mock.patch.object(RefreshToken, 'for_user', wraps=RefreshToken.for_user) as for_user:
+            response = APIClient().post('/api/v1/users/login/', {'email': 'alice@example.com', 'password': 'password'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(for_user.call_count, 1)
+        self.assertIn('access', response.data['data'])
+        self.assertIn('refresh', response.data['data'])
@@ -93,9 +93,9 @@ def get_current_user(request):
     @return   Json
     """
     
-    user = request.user
-    print(user)
     try:
+        # request.user only carries the token claims; load the full profile here.
+        user = CustomUser.objects.get(pk=request.user.id)
         serializer = UserSerializer(user, many=False)
         return Response({'message': 'User found', 'data': serializer.data}, status=status.HTTP_200_OK)
         